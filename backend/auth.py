@@ -4,10 +4,12 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from config import settings
-from database import get_db
+from database import get_async_db
 from models import User
 
 # 密码哈希上下文
@@ -51,25 +53,33 @@ def verify_token(token: str) -> Optional[str]:
         return None
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """获取当前登录用户（依赖注入）"""
-    credentials_exception = HTTPException(
+def credentials_exception() -> HTTPException:
+    """认证失败异常"""
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无效的认证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    token = credentials.credentials
-    username = verify_token(token)
+
+async def get_current_username(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> str:
+    """获取当前登录用户名（依赖注入，仅校验 JWT，不查询数据库）"""
+    username = verify_token(credentials.credentials)
     if username is None:
-        raise credentials_exception
+        raise credentials_exception()
+    return username
 
-    user = db.query(User).filter(User.username == username).first()
+
+async def get_current_user(
+    username: str = Depends(get_current_username),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """获取当前登录用户（依赖注入）"""
+    user = await db.scalar(select(User).where(User.username == username))
     if user is None:
-        raise credentials_exception
+        raise credentials_exception()
 
     return user
 
@@ -1,4 +1,5 @@
 import os
+from functools import cached_property
 from typing import List
 from pydantic_settings import BaseSettings
 
@@ -6,6 +7,9 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     # 数据库
     DATABASE_URL: str = "sqlite:///./data/app.db"
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_RECYCLE: int = 1800  # 秒
 
     # JWT 认证
     JWT_SECRET: str = "your-super-secret-key-change-in-production"
@@ -26,13 +30,24 @@ class Settings(BaseSettings):
     # Banana提示词同步配置
     BANANA_SYNC_ENABLED: bool = True
     BANANA_GITHUB_URL: str = "https://raw.githubusercontent.com/glidea/banana-prompt-quicker/refs/heads/main/prompts.json"
+    # 提示词图片文件存储目录（为空时使用数据库所在目录下的 banana_images）
+    BANANA_IMAGE_DIR: str = ""
 
-    def get_cors_origins(self) -> List[str]:
-        """解析 CORS_ORIGINS 为列表"""
+    @cached_property
+    def cors_origins(self) -> List[str]:
+        """解析 CORS_ORIGINS 为列表（首次访问时解析并缓存）"""
         if self.CORS_ORIGINS == "*":
             return ["*"]
         return [origin.strip() for origin in self.CORS_ORIGINS.split(",") if origin.strip()]
 
+    @cached_property
+    def banana_image_dir(self) -> str:
+        """提示词图片存储目录（默认与 SQLite 数据库放在同一目录，随数据卷持久化）"""
+        if self.BANANA_IMAGE_DIR:
+            return self.BANANA_IMAGE_DIR
+        db_dir = os.path.dirname(self.DATABASE_URL.replace('sqlite:///', ''))
+        return os.path.join(db_dir or ".", "banana_images")
+
     class Config:
         env_file = ".env"
 
@@ -1,6 +1,12 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from config import settings
+import binascii
+import orjson
 import os
 
 # 确保数据库目录存在
@@ -9,30 +15,80 @@ if db_dir and not os.path.exists(db_dir):
     os.makedirs(db_dir)
     print(f"[Database] 创建数据库目录: {db_dir}")
 
-# 创建引擎
+
+def _json_serializer(obj) -> str:
+    """JSON 列序列化（orjson）"""
+    return orjson.dumps(obj).decode()
+
+
+# 创建同步引擎（启动初始化、迁移使用）
 engine = create_engine(
     settings.DATABASE_URL,
+    poolclass=QueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_use_lifo=True,  # 优先复用最近归还的连接
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
     connect_args={"check_same_thread": False}  # SQLite 需要
 )
 
+# 创建异步引擎（请求处理使用，数据库操作不阻塞事件循环）
+async_database_url = make_url(settings.DATABASE_URL)
+if async_database_url.get_backend_name() == "sqlite":
+    async_database_url = async_database_url.set(drivername="sqlite+aiosqlite")
+
+async_engine = create_async_engine(
+    async_database_url,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+    pool_use_lifo=True,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads
+)
+
+
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """新连接建立时设置 SQLite PRAGMA（WAL 模式，读写互不阻塞）"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-64000")  # 64MB
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256MB
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+if engine.dialect.name == "sqlite":
+    for _engine in (engine, async_engine.sync_engine):
+        event.listen(_engine, "connect", _set_sqlite_pragma)
+
 # 创建会话工厂
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    autoflush=False,
+    expire_on_commit=False  # 异步会话中提交后不能隐式懒加载
+)
 
 # 声明基类
 Base = declarative_base()
 
 
-def get_db():
-    """获取数据库会话的依赖"""
-    db = SessionLocal()
-    try:
+async def get_async_db():
+    """获取异步数据库会话的依赖"""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 def run_migrations():
-    """运行数据库迁移（添加新列）"""
+    """运行数据库迁移（添加新列、索引）"""
     migrations = [
         # 为 banana_prompts 表添加 image_url 列
         (
@@ -40,23 +96,121 @@ def run_migrations():
             "image_url",
             "ALTER TABLE banana_prompts ADD COLUMN image_url VARCHAR(500)"
         ),
+        # 为 banana_prompts 表添加 updated_at 列（用于列表 ETag）
+        (
+            "banana_prompts",
+            "updated_at",
+            "ALTER TABLE banana_prompts ADD COLUMN updated_at DATETIME"
+        ),
+        # 为 banana_prompts 表添加 image_path 列（图片改为文件存储）
+        (
+            "banana_prompts",
+            "image_path",
+            "ALTER TABLE banana_prompts ADD COLUMN image_path VARCHAR(255)"
+        ),
     ]
 
-    with engine.connect() as conn:
+    # 索引迁移（语句自身幂等，可重复执行）
+    index_migrations = [
+        # banana_prompts (source, id) 复合索引，取代原 source 单列索引
+        "CREATE INDEX IF NOT EXISTS ix_banana_source_id ON banana_prompts (source, id)",
+        "DROP INDEX IF EXISTS ix_banana_prompts_source",
+        # banana_prompts (source, title) 复合索引，用于同步时的标题比对
+        "CREATE INDEX IF NOT EXISTS ix_banana_source_title ON banana_prompts (source, title)",
+    ]
+
+    # 所有迁移在同一事务中执行，每张表只查询一次现有列
+    with engine.begin() as conn:
+        table_columns = {}
         for table_name, column_name, sql in migrations:
-            # 检查列是否存在
-            result = conn.execute(text(
-                f"SELECT COUNT(*) FROM pragma_table_info('{table_name}') WHERE name='{column_name}'"
-            ))
-            exists = result.scalar() > 0
+            if table_name not in table_columns:
+                table_columns[table_name] = set(conn.execute(
+                    text("SELECT name FROM pragma_table_info(:table_name)"),
+                    {"table_name": table_name}
+                ).scalars().all())
+
+            if column_name in table_columns[table_name]:
+                continue
+
+            try:
+                conn.execute(text(sql))
+                table_columns[table_name].add(column_name)
+                print(f"[Migration] 添加列 {table_name}.{column_name}")
+            except Exception as e:
+                print(f"[Migration] 添加列 {table_name}.{column_name} 失败: {e}")
+
+        for sql in index_migrations:
+            try:
+                conn.execute(text(sql))
+            except Exception as e:
+                print(f"[Migration] 执行 {sql} 失败: {e}")
+
+        # providers.name 唯一索引：先处理历史重名数据；创建失败时中止启动，
+        # 否则接口将不再拦截重名渠道
+        dedupe_provider_names(conn)
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_providers_name ON providers (name)"))
+
+        # 旧版本的 Base64 图片列，存在时将图片迁移为文件
+        if "image" in table_columns["banana_prompts"]:
+            migrate_banana_images(conn)
+
+
+def dedupe_provider_names(conn):
+    """为重名渠道（保留 ID 最小的一条）的名称追加 ID 后缀，后缀名称也被占用时继续追加序号"""
+    rows = conn.execute(text("SELECT id, name FROM providers ORDER BY id")).all()
+    taken = {name for _, name in rows}
+    seen = set()
+    renames = []
+    for provider_id, name in rows:
+        if name not in seen:
+            seen.add(name)
+            continue
+        new_name = f"{name} #{provider_id}"
+        suffix = 2
+        while new_name in taken:
+            new_name = f"{name} #{provider_id}-{suffix}"
+            suffix += 1
+        taken.add(new_name)
+        renames.append({"id": provider_id, "name": new_name})
 
-            if not exists:
+    if renames:
+        conn.execute(text("UPDATE providers SET name = :name WHERE id = :id"), renames)
+        print(f"[Migration] {len(renames)} 个重名渠道已追加 ID 后缀")
+
+
+def is_unique_violation(error: IntegrityError, column: str) -> bool:
+    """判断 IntegrityError 是否由指定列（table.column）的唯一约束引起"""
+    return f"UNIQUE constraint failed: {column}" in str(error.orig)
+
+
+def migrate_banana_images(conn):
+    """将 banana_prompts.image 中的 Base64 图片写入文件，并清空原列（分批处理）"""
+    from services.banana_images import save_image
+
+    migrated = 0
+    while True:
+        rows = conn.execute(text(
+            "SELECT id, image FROM banana_prompts WHERE image IS NOT NULL LIMIT 50"
+        )).all()
+        if not rows:
+            break
+
+        for prompt_id, image in rows:
+            image_path = None
+            if image:
                 try:
-                    conn.execute(text(sql))
-                    conn.commit()
-                    print(f"[Migration] 添加列 {table_name}.{column_name}")
-                except Exception as e:
-                    print(f"[Migration] 添加列 {table_name}.{column_name} 失败: {e}")
+                    image_path = save_image(image)
+                    migrated += 1
+                except (binascii.Error, ValueError) as e:
+                    print(f"[Migration] 提示词 {prompt_id} 图片数据损坏，已丢弃: {e}")
+
+            conn.execute(
+                text("UPDATE banana_prompts SET image_path = :image_path, image = NULL WHERE id = :id"),
+                {"image_path": image_path, "id": prompt_id}
+            )
+
+    if migrated:
+        print(f"[Migration] 迁移 {migrated} 张提示词图片到 {settings.banana_image_dir}")
 
 
 def init_db():
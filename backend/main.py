@@ -1,17 +1,20 @@
 import asyncio
 import logging
 
+import httpx
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
-from database import init_db, SessionLocal
+from database import init_db, SessionLocal, async_engine
 from auth import init_admin_user
 from routes import auth, providers, xhs, generate, xhs_providers, banana
-from services.banana_sync import sync_from_github
+from routes.xhs import init_xhs_config
+from services.banana_sync import banana_sync_service, sync_from_github
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -46,12 +49,14 @@ async def lifespan(app: FastAPI):
     """应用启动和关闭时的生命周期管理"""
     # 启动时初始化
     print("[Startup] 初始化数据库...")
-    init_db()
+    # 建表、迁移和 bcrypt 哈希均为同步阻塞操作，放到线程中执行
+    await asyncio.to_thread(init_db)
 
-    # 创建管理员用户
+    # 创建管理员用户和默认 XHS 配置
     db = SessionLocal()
     try:
-        init_admin_user(db)
+        await asyncio.to_thread(init_admin_user, db)
+        await asyncio.to_thread(init_xhs_config, db)
     finally:
         db.close()
 
@@ -70,11 +75,21 @@ async def lifespan(app: FastAPI):
         asyncio.create_task(scheduled_banana_sync())
         print("[Startup] 首次Banana提示词同步已触发")
 
+    # 共享 HTTP 客户端（复用连接池，避免每次请求重新握手）
+    app.state.http = httpx.AsyncClient(
+        timeout=generate.TIMEOUT,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        http2=True
+    )
+
     print("[Startup] 应用启动完成")
     yield
     # 关闭时清理
+    await app.state.http.aclose()
     if scheduler.running:
         scheduler.shutdown()
+    await banana_sync_service.aclose()
+    await async_engine.dispose()
     print("[Shutdown] 应用关闭")
 
 
@@ -82,20 +97,21 @@ app = FastAPI(
     title="Artify · 智绘工作台 API",
     description="Artify · 智绘工作台后端 API",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
 # CORS 配置（通过环境变量 CORS_ORIGINS 设置，逗号分隔多个域名，* 表示允许所有）
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.get_cors_origins(),
+    allow_origins=settings.cors_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Gzip 压缩（响应体超过 500 字节时自动压缩）
-app.add_middleware(GZipMiddleware, minimum_size=500)
+# Gzip 压缩（响应体超过 1500 字节时压缩，低压缩级别换取更少的 CPU 开销）
+app.add_middleware(GZipMiddleware, minimum_size=1500, compresslevel=1)
 
 # 注册路由
 app.include_router(auth.router)
@@ -1,8 +1,12 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, CheckConstraint, Boolean
-from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, DateTime, CheckConstraint, Boolean, Index, JSON, func
 from database import Base
 
 
+def utcnow():
+    """由 SQLite 在写入时生成当前 UTC 时间（毫秒精度，CURRENT_TIMESTAMP 只精确到秒）"""
+    return func.strftime('%Y-%m-%d %H:%M:%f', 'now')
+
+
 class User(Base):
     """用户表（单用户场景）"""
     __tablename__ = "users"
@@ -10,7 +14,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow())
 
 
 class Provider(Base):
@@ -18,13 +22,13 @@ class Provider(Base):
     __tablename__ = "providers"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), nullable=False)
+    name = Column(String(100), nullable=False, unique=True, index=True)
     type = Column(String(20), nullable=False)  # 'gemini' 或 'openai'
     host = Column(String(500), nullable=False)
     api_key = Column(String(500), nullable=False)
     model = Column(String(100), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow())
+    updated_at = Column(DateTime, default=utcnow(), onupdate=utcnow())
 
     __table_args__ = (
         CheckConstraint("type IN ('gemini', 'openai')", name="check_provider_type"),
@@ -39,9 +43,9 @@ class XHSConfig(Base):
     host = Column(String(500), nullable=False, default='https://api.openai.com')
     api_key = Column(String(500), nullable=True)
     model = Column(String(100), nullable=False, default='gpt-4o')
-    custom_models = Column(Text, nullable=True)  # JSON 数组
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    custom_models = Column(JSON, nullable=True)  # 模型名称数组
+    created_at = Column(DateTime, default=utcnow())
+    updated_at = Column(DateTime, default=utcnow(), onupdate=utcnow())
 
 
 class XHSProvider(Base):
@@ -54,8 +58,8 @@ class XHSProvider(Base):
     api_key = Column(String(500), nullable=False)
     model = Column(String(100), nullable=False, default='gpt-4o')
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=utcnow())
+    updated_at = Column(DateTime, default=utcnow(), onupdate=utcnow())
 
 
 class BananaPrompt(Base):
@@ -69,14 +73,19 @@ class BananaPrompt(Base):
     category = Column(String(50), nullable=True)
     author = Column(String(100), nullable=True)
     link = Column(String(500), nullable=True)
-    image = Column(Text, nullable=True)  # Base64格式图片
+    image_path = Column(String(255), nullable=True)  # 图片文件名（文件位于 settings.banana_image_dir）
     image_url = Column(String(500), nullable=True)  # 原始图片URL（作为fallback）
-    source = Column(String(20), default='github', index=True)  # github/custom
-    created_at = Column(DateTime, default=datetime.utcnow)
+    source = Column(String(20), default='github')  # github/custom
+    created_at = Column(DateTime, default=utcnow())
+    updated_at = Column(DateTime, default=utcnow(), onupdate=utcnow())
 
     __table_args__ = (
         CheckConstraint("source IN ('github', 'custom')", name="check_banana_source"),
         CheckConstraint("mode IN ('generate', 'edit')", name="check_banana_mode"),
+        # 列表查询按 source 过滤并按 id 排序，复合索引可直接顺序扫描
+        Index("ix_banana_source_id", "source", "id"),
+        # 同步时按 source 查询 (id, title)，该索引可覆盖查询
+        Index("ix_banana_source_title", "source", "title"),
     )
 
 
@@ -85,7 +94,7 @@ class BananaSyncLog(Base):
     __tablename__ = "banana_sync_log"
 
     id = Column(Integer, primary_key=True, index=True)
-    synced_at = Column(DateTime, default=datetime.utcnow)
+    synced_at = Column(DateTime, default=utcnow())
     count = Column(Integer, default=0)  # 同步的提示词数量
     status = Column(String(20), default='pending')  # pending/success/failed
     message = Column(Text, nullable=True)  # 错误信息或详情
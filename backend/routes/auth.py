@@ -1,19 +1,24 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
+from database import get_async_db
 from models import User
 from schemas import LoginRequest, TokenResponse
-from auth import verify_password, create_access_token, get_current_user
+from auth import verify_password, create_access_token, get_current_username
 
 router = APIRouter(prefix="/api/auth", tags=["认证"])
 
 
 @router.post("/login", response_model=TokenResponse)
-async def login(request: LoginRequest, db: Session = Depends(get_db)):
+async def login(request: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """用户登录"""
-    user = db.query(User).filter(User.username == request.username).first()
-    if not user or not verify_password(request.password, user.password_hash):
+    user = await db.scalar(select(User).where(User.username == request.username))
+    # bcrypt 校验是 CPU 密集的同步操作，放到线程池执行，避免阻塞事件循环
+    if not user or not await run_in_threadpool(
+        verify_password, request.password, user.password_hash
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误"
@@ -24,6 +29,6 @@ async def login(request: LoginRequest, db: Session = Depends(get_db)):
 
 
 @router.get("/verify")
-async def verify(current_user: User = Depends(get_current_user)):
+async def verify(current_user: str = Depends(get_current_username)):
     """验证 Token 有效性"""
-    return {"valid": True, "username": current_user.username}
+    return {"valid": True, "username": current_user}
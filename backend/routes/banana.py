@@ -2,65 +2,159 @@
 Banana提示词API路由
 """
 
+import binascii
+import os
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import Response
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response
+from pydantic import TypeAdapter
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 import httpx
 
-from database import get_db
+from database import get_async_db
 from models import BananaPrompt
 from schemas import (
     BananaPromptCreate,
     BananaPromptUpdate,
     BananaPromptResponse,
+    BananaPromptListItem,
     BananaSyncStatusResponse,
     BananaSyncResponse,
     BananaImageUpdate
 )
 from services.banana_sync import banana_sync_service
-from auth import get_current_user
+from services.banana_images import save_image, delete_image, image_file_path, image_url
+from auth import get_current_username
 
 router = APIRouter(prefix="/api/banana", tags=["banana"])
 
+# 列表响应序列化器（模块加载时构建一次）
+_prompt_list_adapter = TypeAdapter(List[BananaPromptListItem])
 
-@router.get("/prompts", response_model=List[BananaPromptResponse])
+
+async def store_image(image: str) -> str:
+    """解码上传的 Base64 图片并保存为文件，返回文件名"""
+    try:
+        return await run_in_threadpool(save_image, image)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="图片数据无效")
+
+
+async def get_list_etag(db: AsyncSession, source: str = None) -> str:
+    """
+    根据行数、最大 ID 和最近更新时间计算提示词列表的弱 ETag
+
+    新增、删除、编辑、补图都会改变其中至少一项
+    """
+    stmt = select(
+        func.count(),
+        func.max(BananaPrompt.id),
+        func.max(BananaPrompt.updated_at)
+    )
+    if source:
+        stmt = stmt.where(BananaPrompt.source == source)
+
+    count, max_id, last_updated = (await db.execute(stmt)).one()
+    version = int(last_updated.timestamp() * 1_000_000) if last_updated else 0
+    return f'W/"{count}-{max_id or 0}-{version}"'
+
+
+@router.get("/prompts", response_model=List[BananaPromptListItem])
 async def get_prompts(
+    request: Request,
     source: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    获取所有提示词
+    获取所有提示词（不含 Base64 图片）
+
+    支持 If-None-Match 条件请求，列表未变化时返回 304
 
     Args:
         source: 可选过滤，'github' 或 'custom'
     """
-    query = db.query(BananaPrompt)
+    etag = await get_list_etag(db, source)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    # 只查询列表需要的列，避免从数据库读取大体积的 image 字段
+    stmt = select(
+        BananaPrompt.id,
+        BananaPrompt.title,
+        BananaPrompt.prompt,
+        BananaPrompt.mode,
+        BananaPrompt.category,
+        BananaPrompt.author,
+        BananaPrompt.link,
+        BananaPrompt.image_url,
+        BananaPrompt.image_path.isnot(None).label("has_image"),
+        BananaPrompt.source,
+        BananaPrompt.created_at,
+    )
 
     if source:
-        query = query.filter(BananaPrompt.source == source)
+        stmt = stmt.where(BananaPrompt.source == source)
 
     # 按 ID 正序，保持与 JSON 原始顺序一致
-    return query.order_by(BananaPrompt.id.asc()).all()
+    result = await db.execute(stmt.order_by(BananaPrompt.id.asc()))
+    prompts = _prompt_list_adapter.validate_python(result.all(), from_attributes=True)
+    return Response(
+        content=_prompt_list_adapter.dump_json(prompts),
+        media_type="application/json",
+        headers=headers
+    )
 
 
 @router.get("/prompts/{prompt_id}", response_model=BananaPromptResponse)
 async def get_prompt(
     prompt_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取单个提示词"""
-    prompt = db.query(BananaPrompt).filter(BananaPrompt.id == prompt_id).first()
+    prompt = await db.get(BananaPrompt, prompt_id)
     if not prompt:
         raise HTTPException(status_code=404, detail="提示词不存在")
     return prompt
 
 
+@router.get("/prompts/{prompt_id}/image")
+async def get_prompt_image(
+    request: Request,
+    prompt_id: int,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    获取提示词图片文件（可直接用于 <img src>）
+
+    支持 If-None-Match 条件请求，图片未变化时返回 304
+    """
+    image_path = await db.scalar(
+        select(BananaPrompt.image_path).where(BananaPrompt.id == prompt_id)
+    )
+    if not image_path:
+        raise HTTPException(status_code=404, detail="图片不存在")
+
+    path = image_file_path(image_path)
+    try:
+        stat_result = await run_in_threadpool(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="图片不存在")
+
+    response = FileResponse(path, stat_result=stat_result, headers={"Cache-Control": "no-cache"})
+    etag = response.headers["etag"]
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return response
+
+
 @router.post("/prompts", response_model=BananaPromptResponse)
 async def create_prompt(
     data: BananaPromptCreate,
-    db: Session = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_username)
 ):
     """
     创建自定义提示词
@@ -69,6 +163,7 @@ async def create_prompt(
     """
     # 如果没有指定作者，使用当前用户
     author = data.author if data.author else current_user
+    image_path = await store_image(data.image) if data.image else None
 
     prompt = BananaPrompt(
         title=data.title,
@@ -77,12 +172,15 @@ async def create_prompt(
         category=data.category,
         author=author,
         link=data.link,
-        image=data.image,
+        image_path=image_path,
         source="custom"  # 用户创建的都是custom
     )
     db.add(prompt)
-    db.commit()
-    db.refresh(prompt)
+    try:
+        await db.commit()
+    except Exception:
+        await run_in_threadpool(delete_image, image_path)
+        raise
     return prompt
 
 
@@ -90,15 +188,15 @@ async def create_prompt(
 async def update_prompt(
     prompt_id: int,
     data: BananaPromptUpdate,
-    db: Session = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_username)
 ):
     """
     更新自定义提示词
 
     仅允许更新 source='custom' 的提示词
     """
-    prompt = db.query(BananaPrompt).filter(BananaPrompt.id == prompt_id).first()
+    prompt = await db.get(BananaPrompt, prompt_id)
 
     if not prompt:
         raise HTTPException(status_code=404, detail="提示词不存在")
@@ -108,11 +206,24 @@ async def update_prompt(
 
     # 更新字段
     update_data = data.model_dump(exclude_unset=True)
+    old_image_path = new_image_path = None
+    if "image" in update_data:
+        image = update_data.pop("image")
+        # 传入已存储图片的访问地址（可带域名前缀）表示图片未修改
+        if not (image and image.endswith(image_url(prompt_id))):
+            old_image_path = prompt.image_path
+            new_image_path = await store_image(image) if image else None
+            prompt.image_path = new_image_path
     for key, value in update_data.items():
         setattr(prompt, key, value)
 
-    db.commit()
-    db.refresh(prompt)
+    try:
+        await db.commit()
+    except Exception:
+        await run_in_threadpool(delete_image, new_image_path)
+        raise
+    # 提交成功后再删除被替换的旧图片
+    await run_in_threadpool(delete_image, old_image_path)
     return prompt
 
 
@@ -120,8 +231,8 @@ async def update_prompt(
 async def update_prompt_image(
     prompt_id: int,
     data: BananaImageUpdate,
-    db: Session = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_username)
 ):
     """
     更新提示词图片（前端补图专用）
@@ -129,13 +240,20 @@ async def update_prompt_image(
     无 source 限制，允许为任意提示词补充图片
     需要登录认证
     """
-    prompt = db.query(BananaPrompt).filter(BananaPrompt.id == prompt_id).first()
+    prompt = await db.get(BananaPrompt, prompt_id)
 
     if not prompt:
         raise HTTPException(status_code=404, detail="提示词不存在")
 
-    prompt.image = data.image
-    db.commit()
+    old_image_path = prompt.image_path
+    new_image_path = await store_image(data.image)
+    prompt.image_path = new_image_path
+    try:
+        await db.commit()
+    except Exception:
+        await run_in_threadpool(delete_image, new_image_path)
+        raise
+    await run_in_threadpool(delete_image, old_image_path)
 
     return {"success": True, "message": "图片已更新"}
 
@@ -143,15 +261,15 @@ async def update_prompt_image(
 @router.delete("/prompts/{prompt_id}")
 async def delete_prompt(
     prompt_id: int,
-    db: Session = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_username)
 ):
     """
     删除自定义提示词
 
     仅允许删除 source='custom' 的提示词
     """
-    prompt = db.query(BananaPrompt).filter(BananaPrompt.id == prompt_id).first()
+    prompt = await db.get(BananaPrompt, prompt_id)
 
     if not prompt:
         raise HTTPException(status_code=404, detail="提示词不存在")
@@ -159,16 +277,17 @@ async def delete_prompt(
     if prompt.source != "custom":
         raise HTTPException(status_code=403, detail="只能删除自定义提示词")
 
-    db.delete(prompt)
-    db.commit()
+    await db.delete(prompt)
+    await db.commit()
+    await run_in_threadpool(delete_image, prompt.image_path)
 
     return {"success": True, "message": "删除成功"}
 
 
 @router.post("/sync", response_model=BananaSyncResponse)
 async def sync_prompts(
-    db: Session = Depends(get_db),
-    current_user: str = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_username)
 ):
     """
     手动触发GitHub同步
@@ -181,10 +300,10 @@ async def sync_prompts(
 
 @router.get("/sync/status", response_model=BananaSyncStatusResponse)
 async def get_sync_status(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """获取最近一次同步状态"""
-    status = banana_sync_service.get_latest_sync_status(db)
+    status = await banana_sync_service.get_latest_sync_status(db)
 
     if not status:
         raise HTTPException(status_code=404, detail="暂无同步记录")
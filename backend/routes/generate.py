@@ -1,36 +1,63 @@
-import json
+import asyncio
 import re
+import time
 import base64
+from itertools import chain
+
 import httpx
-from fastapi import APIRouter, Depends, HTTPException
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import AsyncGenerator
 
-from database import get_db
+from database import get_async_db
 from models import Provider, XHSConfig, User
 from schemas import GenerateRequest, XHSGenerateRequest
 from auth import get_current_user
+from routes.providers import get_cached_provider
 
 router = APIRouter(prefix="/api", tags=["AI代理"])
 
 # HTTP 客户端超时配置
 TIMEOUT = httpx.Timeout(300.0, connect=30.0)
 
+# 发送给上游的图片统一按 JPEG data URL 传递
+JPEG_DATA_URL_PREFIX = "data:image/jpeg;base64,"
+
+# 图片下载分块大小（3 的倍数，aiter_bytes 按此大小切块，各块可独立 base64 编码）
+IMAGE_CHUNK_SIZE = 3 * 21845
+
+# 响应内容中的图片标记
+# 1. base64 格式: ![...](data:image/...)
+DATA_URL_RE = re.compile(r'!\[.*?\]\((data:image/[^)]+)\)')
+# 2. URL 格式: ![...](https://...)
+HTTP_URL_RE = re.compile(r'!\[.*?\]\((https?://[^)]+)\)')
+
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    """获取应用级共享的 HTTP 客户端（依赖注入，在 lifespan 中创建）"""
+    return request.app.state.http
+
 
-async def fetch_image_as_base64(url: str) -> str:
-    """下载图片并转换为 base64"""
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        response = await client.get(url)
-        if response.status_code == 200:
-            content_type = response.headers.get('content-type', 'image/jpeg')
-            mime_type = content_type.split(';')[0].strip()
-            b64_data = base64.b64encode(response.content).decode('utf-8')
-            return f"data:{mime_type};base64,{b64_data}"
-    return None
+async def fetch_image_as_base64(client: httpx.AsyncClient, url: str) -> str:
+    """下载图片并转换为 base64（流式读取，边下载边编码）"""
+    async with client.stream("GET", url) as response:
+        if response.status_code != 200:
+            return None
+        content_type = response.headers.get('content-type', 'image/jpeg')
+        mime_type = content_type.split(';')[0].strip()
 
+        # 分块编码后追加到同一个缓冲区，最后只解码一次，避免同时持有多份完整 base64
+        buffer = bytearray(f"data:{mime_type};base64,".encode('ascii'))
+        async for chunk in response.aiter_bytes(IMAGE_CHUNK_SIZE):
+            buffer += base64.b64encode(chunk)
 
-async def process_openai_response(data: dict) -> dict:
+    return buffer.decode('ascii')
+
+
+async def process_openai_response(data: dict, client: httpx.AsyncClient) -> dict:
     """
     处理 OpenAI 格式响应，提取文字和图片
     返回统一格式: { text, images: [{ base64, mimeType }] }
@@ -42,39 +69,35 @@ async def process_openai_response(data: dict) -> dict:
 
     content = data["choices"][0]["message"].get("content", "")
 
-    # 正则提取图片
-    # 1. base64 格式: ![...](data:image/...)
-    data_url_pattern = r'!\[.*?\]\((data:image/[^)]+)\)'
-    # 2. URL 格式: ![...](https://...)
-    http_url_pattern = r'!\[.*?\]\((https?://[^)]+)\)'
-
     # 提取 base64 图片
-    for match in re.finditer(data_url_pattern, content):
+    for match in DATA_URL_RE.finditer(content):
         data_url = match.group(1)
-        # 提取 mime type
-        mime_match = re.match(r'data:([^;]+);', data_url)
-        mime_type = mime_match.group(1) if mime_match else 'image/jpeg'
+        # 提取 mime type（只在短前缀内查找分号）
+        sep = data_url.find(';', 5, 64)
+        mime_type = data_url[5:sep] if sep > 5 else 'image/jpeg'
         result["images"].append({
             "base64": data_url,
             "mimeType": mime_type
         })
 
-    # 提取 URL 图片并转换为 base64
-    for match in re.finditer(http_url_pattern, content):
-        url = match.group(1)
-        try:
-            base64_data = await fetch_image_as_base64(url)
-            if base64_data:
-                result["images"].append({
-                    "base64": base64_data,
-                    "mimeType": "image/jpeg"
-                })
-        except Exception as e:
-            print(f"[generate] Failed to fetch image from {url}: {e}")
+    # 提取 URL 图片并并发转换为 base64
+    urls = [match.group(1) for match in HTTP_URL_RE.finditer(content)]
+    fetched = await asyncio.gather(
+        *(fetch_image_as_base64(client, url) for url in urls),
+        return_exceptions=True
+    )
+    for url, base64_data in zip(urls, fetched):
+        if isinstance(base64_data, Exception):
+            print(f"[generate] Failed to fetch image from {url}: {base64_data}")
+        elif base64_data:
+            result["images"].append({
+                "base64": base64_data,
+                "mimeType": "image/jpeg"
+            })
 
     # 移除图片标记后的文字
-    text = re.sub(data_url_pattern, '', content)
-    text = re.sub(http_url_pattern, '', text)
+    text = DATA_URL_RE.sub('', content)
+    text = HTTP_URL_RE.sub('', text)
     result["text"] = text.strip()
 
     return result
@@ -127,21 +150,11 @@ def build_openai_payload(request: GenerateRequest, provider: Provider) -> dict:
     # 构建当前用户消息
     current_content = [{"type": "text", "text": request.prompt or "Generate image"}]
 
-    # 先添加历史图片（上下文图片）
-    if request.context_images:
-        for img_b64 in request.context_images:
-            current_content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}
-            })
-
-    # 再添加当前图片
-    if request.images:
-        for img_b64 in request.images:
-            current_content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}
-            })
+    # 先添加历史图片（上下文图片），再添加当前图片
+    current_content.extend(
+        {"type": "image_url", "image_url": {"url": JPEG_DATA_URL_PREFIX + img_b64}}
+        for img_b64 in chain(request.context_images or (), request.images or ())
+    )
 
     messages.append({"role": "user", "content": current_content})
 
@@ -177,25 +190,11 @@ def build_gemini_payload(request: GenerateRequest, provider: Provider) -> dict:
     # 构建当前用户消息
     current_parts = [{"text": request.prompt or "Generate image"}]
 
-    # 先添加历史图片（上下文图片）
-    if request.context_images:
-        for img_b64 in request.context_images:
-            current_parts.append({
-                "inline_data": {
-                    "mime_type": "image/jpeg",
-                    "data": img_b64
-                }
-            })
-
-    # 再添加当前图片
-    if request.images:
-        for img_b64 in request.images:
-            current_parts.append({
-                "inline_data": {
-                    "mime_type": "image/jpeg",
-                    "data": img_b64
-                }
-            })
+    # 先添加历史图片（上下文图片），再添加当前图片
+    current_parts.extend(
+        {"inline_data": {"mime_type": "image/jpeg", "data": img_b64}}
+        for img_b64 in chain(request.context_images or (), request.images or ())
+    )
 
     contents.append({"role": "user", "parts": current_parts})
 
@@ -215,23 +214,28 @@ def build_gemini_payload(request: GenerateRequest, provider: Provider) -> dict:
     }
 
 
-async def stream_proxy(url: str, headers: dict, payload: dict) -> AsyncGenerator[bytes, None]:
+async def stream_proxy(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: dict,
+    payload: dict
+) -> AsyncGenerator[bytes, None]:
     """流式代理转发"""
-    async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-        async with client.stream("POST", url, headers=headers, json=payload) as response:
-            async for chunk in response.aiter_bytes():
-                yield chunk
+    async with client.stream("POST", url, headers=headers, json=payload) as response:
+        async for chunk in response.aiter_bytes():
+            yield chunk
 
 
 @router.post("/generate")
 async def generate(
     request: GenerateRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user),
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
     """AI 图像生成代理"""
     # 获取渠道配置
-    provider = db.query(Provider).filter(Provider.id == request.provider_id).first()
+    provider = await get_cached_provider(db, request.provider_id)
     if not provider:
         raise HTTPException(status_code=404, detail="渠道不存在")
 
@@ -247,37 +251,35 @@ async def generate(
 
             if request.settings.streaming:
                 return StreamingResponse(
-                    stream_proxy(url, headers, payload),
+                    stream_proxy(client, url, headers, payload),
                     media_type="text/event-stream"
                 )
             else:
-                async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-                    response = await client.post(url, headers=headers, json=payload)
-                    if response.status_code != 200:
-                        raise HTTPException(
-                            status_code=response.status_code,
-                            detail=response.text
-                        )
-                    data = response.json()
-                    # 处理响应，统一格式
-                    return await process_openai_response(data)
-
-        else:
-            # Gemini 原生格式
-            payload = build_gemini_payload(request, provider)
-            url = f"{provider.host.rstrip('/')}/v1beta/models/{provider.model}:generateContent?key={provider.api_key}"
-            headers = {"Content-Type": "application/json"}
-
-            async with httpx.AsyncClient(timeout=TIMEOUT) as client:
                 response = await client.post(url, headers=headers, json=payload)
                 if response.status_code != 200:
                     raise HTTPException(
                         status_code=response.status_code,
                         detail=response.text
                     )
-                data = response.json()
+                data = orjson.loads(response.content)
                 # 处理响应，统一格式
-                return process_gemini_response(data)
+                return await process_openai_response(data, client)
+
+        else:
+            # Gemini 原生格式
+            payload = build_gemini_payload(request, provider)
+            url = f"{provider.host.rstrip('/')}/v1beta/models/{provider.model}:generateContent?key={provider.api_key}"
+            headers = {"Content-Type": "application/json"}
+
+            response = await client.post(url, headers=headers, json=payload)
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=response.status_code,
+                    detail=response.text
+                )
+            data = orjson.loads(response.content)
+            # 处理响应，统一格式
+            return process_gemini_response(data)
 
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="请求超时")
@@ -288,12 +290,13 @@ async def generate(
 @router.post("/xhs/generate")
 async def xhs_generate(
     request: XHSGenerateRequest,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user),
+    client: httpx.AsyncClient = Depends(get_http_client)
 ):
     """XHS 文案生成代理"""
     # 获取 XHS 配置
-    config = db.query(XHSConfig).first()
+    config = await db.scalar(select(XHSConfig).limit(1))
     if not config or not config.api_key:
         raise HTTPException(status_code=400, detail="请先配置文案生成 API")
 
@@ -301,11 +304,10 @@ async def xhs_generate(
     content = [{"type": "text", "text": request.system_prompt + "\n\n需求：" + request.topic}]
 
     if request.images:
-        for img_b64 in request.images:
-            content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{img_b64}"}
-            })
+        content.extend(
+            {"type": "image_url", "image_url": {"url": JPEG_DATA_URL_PREFIX + img_b64}}
+            for img_b64 in request.images
+        )
 
     payload = {
         "model": config.model,
@@ -320,33 +322,26 @@ async def xhs_generate(
     }
 
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail=response.text
-                )
+        response = await client.post(url, headers=headers, json=payload)
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=response.status_code,
+                detail=response.text
+            )
 
-            data = response.json()
+        data = orjson.loads(response.content)
 
-            # 解析 JSON 响应
-            content_text = data["choices"][0]["message"]["content"]
-            clean_json = content_text.replace("```json", "").replace("```", "").strip()
-            outline = json.loads(clean_json)
-            outline["id"] = int(import_time() * 1000)
+        # 解析 JSON 响应
+        content_text = data["choices"][0]["message"]["content"]
+        clean_json = content_text.replace("```json", "").replace("```", "").strip()
+        outline = orjson.loads(clean_json)
+        outline["id"] = time.time_ns() // 1_000_000
 
-            return outline
+        return outline
 
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         raise HTTPException(status_code=500, detail=f"解析响应失败: {str(e)}")
     except httpx.TimeoutException:
         raise HTTPException(status_code=504, detail="请求超时")
     except httpx.RequestError as e:
         raise HTTPException(status_code=502, detail=f"请求失败: {str(e)}")
-
-
-def import_time():
-    """获取时间戳"""
-    import time
-    return time.time()
@@ -1,37 +1,102 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-
-from database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from typing import List, Optional
+
+from cachetools import TTLCache
+
+from database import get_async_db, is_unique_violation
 from models import Provider, User
 from schemas import ProviderCreate, ProviderUpdate, ProviderResponse
 from auth import get_current_user
 
 router = APIRouter(prefix="/api/providers", tags=["渠道配置"])
 
+# 渠道配置缓存（读多写少，写操作后整体失效；仅在当前进程内有效）
+_provider_cache = TTLCache(maxsize=256, ttl=300)
+# 缓存版本号，写操作提交后递增；查询期间版本发生变化时不回填，避免把失效前读到的旧数据写回缓存
+_provider_cache_version = 0
+
+# 列表响应序列化器（模块加载时构建一次）
+_provider_list_adapter = TypeAdapter(List[ProviderResponse])
+
+
+def _invalidate_provider_cache():
+    """写操作提交后使缓存失效"""
+    global _provider_cache_version
+    _provider_cache_version += 1
+    _provider_cache.clear()
+
+
+async def get_cached_provider(db: AsyncSession, provider_id: int) -> Optional[Provider]:
+    """按 ID 获取渠道（优先读缓存，返回已脱离会话的对象，只读）"""
+    provider = _provider_cache.get(provider_id)
+    if provider is None:
+        version = _provider_cache_version
+        provider = await db.get(Provider, provider_id)
+        if provider is not None:
+            # 从会话中移出后再缓存，避免该会话回滚或过期时影响其他请求共享的对象
+            db.expunge(provider)
+            if version == _provider_cache_version:
+                _provider_cache[provider_id] = provider
+    return provider
+
+
+async def get_list_etag(db: AsyncSession) -> str:
+    """根据行数、最大 ID 和最近更新时间计算渠道列表的弱 ETag"""
+    count, max_id, last_updated = (await db.execute(select(
+        func.count(),
+        func.max(Provider.id),
+        func.max(Provider.updated_at)
+    ))).one()
+    version = int(last_updated.timestamp() * 1_000_000) if last_updated else 0
+    return f'W/"{count}-{max_id or 0}-{version}"'
+
 
 @router.get("", response_model=List[ProviderResponse])
 async def get_providers(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取所有渠道配置"""
-    providers = db.query(Provider).all()
-    return providers
+    """获取所有渠道配置（支持 If-None-Match 条件请求）"""
+    etag = await get_list_etag(db)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    # 缓存序列化后的列表 JSON 及其对应的 ETag，只有 ETag 一致时才复用，保证正文与 ETag 匹配
+    cached = _provider_cache.get("all")
+    if cached is not None and cached[0] == etag:
+        content = cached[1]
+    else:
+        # 列表不返回 api_key，只加载响应需要的列
+        result = await db.execute(
+            select(Provider).options(load_only(
+                Provider.id, Provider.name, Provider.type,
+                Provider.host, Provider.model, Provider.created_at
+            ))
+        )
+        providers = _provider_list_adapter.validate_python(
+            result.scalars().all(), from_attributes=True
+        )
+        content = _provider_list_adapter.dump_json(providers)
+        # ETag 在查询列表之前计算，列表数据不会比 ETag 旧
+        _provider_cache["all"] = (etag, content)
+    return Response(content=content, media_type="application/json", headers=headers)
 
 
 @router.post("", response_model=ProviderResponse, status_code=status.HTTP_201_CREATED)
 async def create_provider(
     provider: ProviderCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """创建新渠道"""
-    # 检查名称是否重复
-    existing = db.query(Provider).filter(Provider.name == provider.name).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="渠道名称已存在")
-
     db_provider = Provider(
         name=provider.name,
         type=provider.type,
@@ -40,8 +105,15 @@ async def create_provider(
         model=provider.model
     )
     db.add(db_provider)
-    db.commit()
-    db.refresh(db_provider)
+    # 名称唯一性由数据库唯一索引保证
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e, "providers.name"):
+            raise HTTPException(status_code=400, detail="渠道名称已存在")
+        raise
+    _invalidate_provider_cache()
     return db_provider
 
 
@@ -49,11 +121,11 @@ async def create_provider(
 async def update_provider(
     provider_id: int,
     provider: ProviderUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """更新渠道配置"""
-    db_provider = db.query(Provider).filter(Provider.id == provider_id).first()
+    db_provider = await db.get(Provider, provider_id)
     if not db_provider:
         raise HTTPException(status_code=404, detail="渠道不存在")
 
@@ -63,35 +135,42 @@ async def update_provider(
         if value is not None:
             setattr(db_provider, key, value)
 
-    db.commit()
-    db.refresh(db_provider)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e, "providers.name"):
+            raise HTTPException(status_code=400, detail="渠道名称已存在")
+        raise
+    _invalidate_provider_cache()
     return db_provider
 
 
 @router.delete("/{provider_id}")
 async def delete_provider(
     provider_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """删除渠道"""
-    db_provider = db.query(Provider).filter(Provider.id == provider_id).first()
+    db_provider = await db.get(Provider, provider_id)
     if not db_provider:
         raise HTTPException(status_code=404, detail="渠道不存在")
 
-    db.delete(db_provider)
-    db.commit()
+    await db.delete(db_provider)
+    await db.commit()
+    _invalidate_provider_cache()
     return {"message": "删除成功"}
 
 
 @router.get("/{provider_id}")
 async def get_provider(
     provider_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取单个渠道（内部使用，包含 api_key）"""
-    db_provider = db.query(Provider).filter(Provider.id == provider_id).first()
+    db_provider = await get_cached_provider(db, provider_id)
     if not db_provider:
         raise HTTPException(status_code=404, detail="渠道不存在")
     return db_provider
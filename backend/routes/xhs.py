@@ -1,49 +1,56 @@
-import json
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from database import get_db
+from database import get_async_db
 from models import XHSConfig, User
 from schemas import XHSConfigUpdate, XHSConfigResponse
 from auth import get_current_user
 
 router = APIRouter(prefix="/api/xhs-config", tags=["XHS配置"])
 
+# XHS 配置为单行表，固定主键
+XHS_CONFIG_ID = 1
 
-def get_or_create_config(db: Session) -> XHSConfig:
-    """获取或创建 XHS 配置（单例模式）"""
-    config = db.query(XHSConfig).first()
+
+def insert_default_config():
+    """插入默认 XHS 配置行的语句（已存在则忽略）"""
+    return sqlite_insert(XHSConfig).values(
+        id=XHS_CONFIG_ID,
+        host='https://api.openai.com',
+        model='gpt-4o'
+    ).on_conflict_do_nothing()
+
+
+def init_xhs_config(db: Session):
+    """初始化 XHS 配置（如果不存在）"""
+    db.execute(insert_default_config())
+    db.commit()
+
+
+async def get_or_create_config(db: AsyncSession) -> XHSConfig:
+    """获取或创建 XHS 配置（单例模式，配置行在启动时已创建）"""
+    config = await db.get(XHSConfig, XHS_CONFIG_ID)
     if not config:
-        config = XHSConfig(
-            host='https://api.openai.com',
-            model='gpt-4o'
-        )
-        db.add(config)
-        db.commit()
-        db.refresh(config)
+        await db.execute(insert_default_config())
+        await db.commit()
+        config = await db.get(XHSConfig, XHS_CONFIG_ID)
     return config
 
 
 @router.get("", response_model=XHSConfigResponse)
 async def get_xhs_config(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取 XHS API 配置"""
-    config = get_or_create_config(db)
-
-    # 解析 custom_models JSON
-    custom_models = []
-    if config.custom_models:
-        try:
-            custom_models = json.loads(config.custom_models)
-        except:
-            pass
+    config = await get_or_create_config(db)
 
     return XHSConfigResponse(
         host=config.host,
         model=config.model,
-        custom_models=custom_models,
+        custom_models=config.custom_models or [],
         has_key=bool(config.api_key)
     )
 
@@ -51,11 +58,11 @@ async def get_xhs_config(
 @router.put("", response_model=XHSConfigResponse)
 async def update_xhs_config(
     update: XHSConfigUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """更新 XHS API 配置"""
-    config = get_or_create_config(db)
+    config = await get_or_create_config(db)
 
     if update.host is not None:
         config.host = update.host
@@ -64,22 +71,13 @@ async def update_xhs_config(
     if update.model is not None:
         config.model = update.model
     if update.custom_models is not None:
-        config.custom_models = json.dumps(update.custom_models)
-
-    db.commit()
-    db.refresh(config)
+        config.custom_models = update.custom_models
 
-    # 解析 custom_models JSON
-    custom_models = []
-    if config.custom_models:
-        try:
-            custom_models = json.loads(config.custom_models)
-        except:
-            pass
+    await db.commit()
 
     return XHSConfigResponse(
         host=config.host,
         model=config.model,
-        custom_models=custom_models,
+        custom_models=config.custom_models or [],
         has_key=bool(config.api_key)
     )
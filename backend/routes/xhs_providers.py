@@ -1,37 +1,84 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+from typing import List, Optional
 
-from database import get_db
+from cachetools import TTLCache
+
+from database import get_async_db, is_unique_violation
 from models import XHSProvider, User
 from schemas import XHSProviderCreate, XHSProviderUpdate, XHSProviderResponse
 from auth import get_current_user
 
 router = APIRouter(prefix="/api/xhs-providers", tags=["文案API管理"])
 
+# XHS渠道配置缓存（读多写少，写操作后整体失效；仅在当前进程内有效）
+_xhs_provider_cache = TTLCache(maxsize=256, ttl=300)
+# 缓存版本号，写操作提交后递增；查询期间版本发生变化时不回填，避免把失效前读到的旧数据写回缓存
+_xhs_provider_cache_version = 0
+
+# 列表响应序列化器（模块加载时构建一次）
+_xhs_provider_list_adapter = TypeAdapter(List[XHSProviderResponse])
+
+
+def _invalidate_xhs_provider_cache():
+    """写操作提交后使缓存失效"""
+    global _xhs_provider_cache_version
+    _xhs_provider_cache_version += 1
+    _xhs_provider_cache.clear()
+
+
+async def get_cached_xhs_provider(db: AsyncSession, provider_id: int) -> Optional[XHSProvider]:
+    """按 ID 获取XHS渠道（优先读缓存，返回已脱离会话的对象，只读）"""
+    provider = _xhs_provider_cache.get(provider_id)
+    if provider is None:
+        version = _xhs_provider_cache_version
+        provider = await db.get(XHSProvider, provider_id)
+        if provider is not None:
+            # 从会话中移出后再缓存，避免该会话回滚或过期时影响其他请求共享的对象
+            db.expunge(provider)
+            if version == _xhs_provider_cache_version:
+                _xhs_provider_cache[provider_id] = provider
+    return provider
+
 
 @router.get("", response_model=List[XHSProviderResponse])
 async def get_xhs_providers(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取所有XHS渠道配置"""
-    providers = db.query(XHSProvider).all()
-    return providers
+    # 缓存序列化后的列表 JSON
+    content = _xhs_provider_cache.get("all")
+    if content is None:
+        version = _xhs_provider_cache_version
+        # 列表不返回 api_key，只加载响应需要的列
+        result = await db.execute(
+            select(XHSProvider).options(load_only(
+                XHSProvider.id, XHSProvider.name, XHSProvider.host,
+                XHSProvider.model, XHSProvider.is_active, XHSProvider.created_at
+            ))
+        )
+        providers = _xhs_provider_list_adapter.validate_python(
+            result.scalars().all(), from_attributes=True
+        )
+        content = _xhs_provider_list_adapter.dump_json(providers)
+        if version == _xhs_provider_cache_version:
+            _xhs_provider_cache["all"] = content
+    return Response(content=content, media_type="application/json")
 
 
 @router.post("", response_model=XHSProviderResponse, status_code=status.HTTP_201_CREATED)
 async def create_xhs_provider(
     provider: XHSProviderCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """创建新XHS渠道"""
-    # 检查名称是否重复
-    existing = db.query(XHSProvider).filter(XHSProvider.name == provider.name).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="渠道名称已存在")
-
     db_provider = XHSProvider(
         name=provider.name,
         host=provider.host,
@@ -39,8 +86,15 @@ async def create_xhs_provider(
         model=provider.model
     )
     db.add(db_provider)
-    db.commit()
-    db.refresh(db_provider)
+    # 名称唯一性由数据库唯一约束保证
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e, "xhs_providers.name"):
+            raise HTTPException(status_code=400, detail="渠道名称已存在")
+        raise
+    _invalidate_xhs_provider_cache()
     return db_provider
 
 
@@ -48,58 +102,56 @@ async def create_xhs_provider(
 async def update_xhs_provider(
     provider_id: int,
     provider: XHSProviderUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """更新XHS渠道配置"""
-    db_provider = db.query(XHSProvider).filter(XHSProvider.id == provider_id).first()
+    db_provider = await db.get(XHSProvider, provider_id)
     if not db_provider:
         raise HTTPException(status_code=404, detail="渠道不存在")
 
-    # 检查名称是否与其他渠道重复
-    if provider.name:
-        existing = db.query(XHSProvider).filter(
-            XHSProvider.name == provider.name,
-            XHSProvider.id != provider_id
-        ).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="渠道名称已存在")
-
     # 更新非空字段
     update_data = provider.model_dump(exclude_unset=True)
     for key, value in update_data.items():
         if value is not None:
             setattr(db_provider, key, value)
 
-    db.commit()
-    db.refresh(db_provider)
+    try:
+        await db.commit()
+    except IntegrityError as e:
+        await db.rollback()
+        if is_unique_violation(e, "xhs_providers.name"):
+            raise HTTPException(status_code=400, detail="渠道名称已存在")
+        raise
+    _invalidate_xhs_provider_cache()
     return db_provider
 
 
 @router.delete("/{provider_id}")
 async def delete_xhs_provider(
     provider_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """删除XHS渠道"""
-    db_provider = db.query(XHSProvider).filter(XHSProvider.id == provider_id).first()
+    db_provider = await db.get(XHSProvider, provider_id)
     if not db_provider:
         raise HTTPException(status_code=404, detail="渠道不存在")
 
-    db.delete(db_provider)
-    db.commit()
+    await db.delete(db_provider)
+    await db.commit()
+    _invalidate_xhs_provider_cache()
     return {"message": "删除成功"}
 
 
 @router.get("/{provider_id}")
 async def get_xhs_provider(
     provider_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取单个XHS渠道（内部使用，包含 api_key）"""
-    db_provider = db.query(XHSProvider).filter(XHSProvider.id == provider_id).first()
+    db_provider = await get_cached_xhs_provider(db, provider_id)
     if not db_provider:
         raise HTTPException(status_code=404, detail="渠道不存在")
     return db_provider
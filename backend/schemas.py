@@ -1,7 +1,9 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+from typing import Literal, Optional, List
 from datetime import datetime
 
+from services.banana_images import image_url
+
 
 # ===== 认证相关 =====
 class LoginRequest(BaseModel):
@@ -17,7 +19,7 @@ class TokenResponse(BaseModel):
 # ===== 渠道配置相关 =====
 class ProviderBase(BaseModel):
     name: str
-    type: str  # 'gemini' 或 'openai'
+    type: Literal['gemini', 'openai']
     host: str
     model: str
 
@@ -28,7 +30,7 @@ class ProviderCreate(ProviderBase):
 
 class ProviderUpdate(BaseModel):
     name: Optional[str] = None
-    type: Optional[str] = None
+    type: Optional[Literal['gemini', 'openai']] = None
     host: Optional[str] = None
     api_key: Optional[str] = None
     model: Optional[str] = None
@@ -39,8 +41,7 @@ class ProviderResponse(ProviderBase):
     created_at: datetime
     # 注意：不返回 api_key
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class ProviderWithKey(ProviderBase):
@@ -48,8 +49,7 @@ class ProviderWithKey(ProviderBase):
     id: int
     api_key: str
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ===== XHS 配置相关 =====
@@ -69,8 +69,7 @@ class XHSConfigUpdate(BaseModel):
 class XHSConfigResponse(XHSConfigBase):
     has_key: bool = False  # 是否已配置 API Key
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ===== AI 生成相关 =====
@@ -128,8 +127,7 @@ class XHSProviderResponse(XHSProviderBase):
     created_at: datetime
     # 注意：不返回 api_key
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class XHSProviderWithKey(XHSProviderBase):
@@ -138,8 +136,7 @@ class XHSProviderWithKey(XHSProviderBase):
     api_key: str
     is_active: bool
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 # ===== Banana 提示词相关 =====
@@ -150,7 +147,7 @@ class BananaPromptBase(BaseModel):
     category: Optional[str] = None
     author: Optional[str] = None
     link: Optional[str] = None
-    image: Optional[str] = None  # Base64格式图片
+    image: Optional[str] = None  # 上传时为Base64格式图片，返回时为图片访问地址
     image_url: Optional[str] = None  # 原始图片URL（作为fallback）
 
 
@@ -173,9 +170,33 @@ class BananaPromptResponse(BananaPromptBase):
     id: int
     source: str
     created_at: datetime
+    image_path: Optional[str] = Field(default=None, exclude=True)
+
+    model_config = ConfigDict(from_attributes=True)
+
+    @model_validator(mode="after")
+    def set_image(self):
+        """图片以文件存储，image 返回图片访问地址"""
+        if self.image_path:
+            self.image = image_url(self.id)
+        return self
+
+
+class BananaPromptListItem(BaseModel):
+    """列表项（不含 Base64 图片，图片通过 /prompts/{id}/image 按需加载）"""
+    id: int
+    title: str
+    prompt: str
+    mode: str = 'generate'
+    category: Optional[str] = None
+    author: Optional[str] = None
+    link: Optional[str] = None
+    image_url: Optional[str] = None
+    has_image: bool = False  # 是否已有本地图片
+    source: str
+    created_at: datetime
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class BananaSyncStatusResponse(BaseModel):
@@ -185,8 +206,7 @@ class BananaSyncStatusResponse(BaseModel):
     status: str
     message: Optional[str] = None
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class BananaSyncResponse(BaseModel):
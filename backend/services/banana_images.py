@@ -0,0 +1,84 @@
+"""
+Banana提示词图片存储
+图片以文件形式保存在 settings.banana_image_dir 目录下，数据库只记录文件名
+"""
+
+import base64
+import os
+import uuid
+from typing import Optional, Tuple
+
+from config import settings
+
+# MIME 类型 -> 文件扩展名（未知类型按 JPEG 处理）
+IMAGE_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/webp": ".webp",
+    "image/gif": ".gif",
+    "image/avif": ".avif",
+    "image/bmp": ".bmp",
+}
+
+
+def decode_image(image: str) -> Tuple[bytes, str]:
+    """
+    解码 Base64 图片（兼容带 data URL 前缀和纯 Base64 两种格式）
+
+    Returns:
+        (图片二进制数据, 文件扩展名)
+
+    Raises:
+        binascii.Error / ValueError: Base64 数据无效
+    """
+    mime_type = "image/jpeg"
+    if image.startswith("data:"):
+        header, _, image = image.partition(",")
+        mime_type = header[5:].split(";", 1)[0] or mime_type
+
+    content = base64.b64decode(image)
+    if not content:
+        raise ValueError("图片数据为空")
+    return content, IMAGE_EXTENSIONS.get(mime_type, ".jpg")
+
+
+def image_url(prompt_id: int) -> str:
+    """获取提示词图片的访问地址"""
+    return f"/api/banana/prompts/{prompt_id}/image"
+
+
+def image_file_path(filename: str) -> str:
+    """获取图片文件的完整路径"""
+    return os.path.join(settings.banana_image_dir, filename)
+
+
+def save_image(image: str) -> str:
+    """
+    解码 Base64 图片并写入文件（同步阻塞操作，路由中需放到线程池执行）
+
+    每次保存使用新的文件名，旧文件由调用方在提交后删除
+
+    Returns:
+        文件名
+    """
+    content, ext = decode_image(image)
+    os.makedirs(settings.banana_image_dir, exist_ok=True)
+
+    filename = f"{uuid.uuid4().hex}{ext}"
+    path = image_file_path(filename)
+    # 先写临时文件再重命名，避免读到写了一半的图片
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return filename
+
+
+def delete_image(filename: Optional[str]):
+    """删除图片文件（文件不存在时忽略）"""
+    if not filename:
+        return
+    try:
+        os.remove(image_file_path(filename))
+    except FileNotFoundError:
+        pass
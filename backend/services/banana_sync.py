@@ -5,17 +5,53 @@ Banana提示词同步服务
 
 import asyncio
 import logging
-from typing import Optional, Dict, Any, List
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Mapping, Tuple
+from urllib.parse import urlsplit
 
 import httpx
-from sqlalchemy.orm import Session
+import orjson
+from sqlalchemy import select, insert, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
 from models import BananaPrompt, BananaSyncLog
-from database import SessionLocal
+from database import AsyncSessionLocal
+from services.banana_images import delete_image
 
 logger = logging.getLogger(__name__)
 
+# 基础请求头（只读）
+BASE_HEADERS = MappingProxyType({
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
+    "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Connection": "keep-alive",
+    "Sec-Ch-Ua": '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
+    "Sec-Ch-Ua-Mobile": "?0",
+    "Sec-Ch-Ua-Platform": '"Windows"',
+    "Sec-Fetch-Dest": "image",
+    "Sec-Fetch-Mode": "no-cors",
+    "Sec-Fetch-Site": "cross-site",
+})
+
+# 各站点需要额外设置的请求头（按域名后缀匹配，与基础请求头合并）
+SITE_HEADERS = (
+    ("linux.do", MappingProxyType({
+        "Referer": "https://linux.do/",
+        "Origin": "https://linux.do",
+        "Sec-Fetch-Site": "same-origin",
+    })),
+    ("github.com", MappingProxyType({"Referer": "https://github.com/"})),
+    ("githubusercontent.com", MappingProxyType({"Referer": "https://github.com/"})),
+    ("jsdelivr.net", MappingProxyType({"Referer": "https://github.com/"})),
+)
+NO_SITE_HEADERS = MappingProxyType({})
+
+# GitHub 数据未变化（304）时 _fetch_github_data 返回的标记
+NOT_MODIFIED = object()
+
 
 class BananaSyncService:
     """Banana提示词同步服务"""
@@ -24,20 +60,37 @@ class BananaSyncService:
         self.github_url = settings.BANANA_GITHUB_URL
         self.max_retries = 3
         self.base_delay = 1  # 基础延迟（秒）
-        # 基础请求头
-        self.base_headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36",
-            "Accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-            "Accept-Encoding": "gzip, deflate, br",
-            "Connection": "keep-alive",
-            "Sec-Ch-Ua": '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
-            "Sec-Ch-Ua-Mobile": "?0",
-            "Sec-Ch-Ua-Platform": '"Windows"',
-            "Sec-Fetch-Dest": "image",
-            "Sec-Fetch-Mode": "no-cors",
-            "Sec-Fetch-Site": "cross-site",
-        }
+        # 限制并发下载数
+        self._semaphore = asyncio.Semaphore(16)
+        # 同一时间只允许一个同步任务运行
+        self._sync_lock = asyncio.Lock()
+        # 上次成功同步的 GitHub 数据 ETag（用于条件请求）
+        self._github_etag: Optional[str] = None
+        # 域名 -> 站点请求头（首次访问某域名时计算并缓存）
+        self._host_headers: Dict[str, Mapping[str, str]] = {}
+        # 复用的 HTTP 客户端（代理 / 直连各一个，首次使用时创建）
+        self._clients: Dict[bool, httpx.AsyncClient] = {}
+
+    def _get_client(self, use_proxy: bool) -> httpx.AsyncClient:
+        """获取复用的 HTTP 客户端（保持连接池，避免每次请求重新握手）"""
+        client = self._clients.get(use_proxy)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                proxies=self._get_proxy_config() if use_proxy else None,
+                timeout=httpx.Timeout(60.0, connect=30.0),
+                follow_redirects=True,
+                headers=BASE_HEADERS,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+            )
+            self._clients[use_proxy] = client
+        return client
+
+    async def aclose(self):
+        """关闭复用的 HTTP 客户端"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
 
     def _get_proxy_config(self) -> Optional[Dict[str, str]]:
         """获取代理配置"""
@@ -50,12 +103,29 @@ class BananaSyncService:
             return proxies
         return None
 
+    def _get_site_headers(self, url: str) -> Mapping[str, str]:
+        """根据 URL 域名获取站点特定请求头"""
+        netloc = urlsplit(url).netloc
+        headers = self._host_headers.get(netloc)
+        if headers is None:
+            host = netloc.rsplit("@", 1)[-1].split(":", 1)[0].lower()
+            headers = next(
+                (
+                    site_headers for suffix, site_headers in SITE_HEADERS
+                    if host == suffix or host.endswith("." + suffix)
+                ),
+                NO_SITE_HEADERS
+            )
+            self._host_headers[netloc] = headers
+        return headers
+
     async def _download_with_retry(
         self,
         url: str,
         use_proxy: bool = True,
-        timeout: float = 60.0
-    ) -> Optional[bytes]:
+        timeout: float = 60.0,
+        etag: Optional[str] = None
+    ) -> Optional[httpx.Response]:
         """
         带指数退避重试的下载
 
@@ -63,36 +133,27 @@ class BananaSyncService:
             url: 下载URL
             use_proxy: 是否使用代理
             timeout: 超时时间
+            etag: 上次获取的 ETag，传入时发送条件请求
 
         Returns:
-            下载的字节数据，失败返回None
+            响应（成功或 304），失败返回None
         """
-        proxies = self._get_proxy_config() if use_proxy else None
+        client = self._get_client(use_proxy)
+        request_headers = self._get_site_headers(url)
+        if etag:
+            request_headers = {**request_headers, "If-None-Match": etag}
 
         for attempt in range(self.max_retries):
             try:
-                # 构建完整的请求头
-                request_headers = self.base_headers.copy()
-
-                # 根据不同网站设置特定的请求头
-                if "linux.do" in url:
-                    request_headers["Referer"] = "https://linux.do/"
-                    request_headers["Origin"] = "https://linux.do"
-                    request_headers["Sec-Fetch-Site"] = "same-origin"
-                elif "github" in url or "githubusercontent" in url:
-                    request_headers["Referer"] = "https://github.com/"
-                elif "jsdelivr" in url:
-                    request_headers["Referer"] = "https://github.com/"
-
-                async with httpx.AsyncClient(
-                    proxies=proxies,
-                    timeout=httpx.Timeout(timeout, connect=30.0),
-                    follow_redirects=True,
-                    headers=request_headers
-                ) as client:
-                    response = await client.get(url)
+                async with self._semaphore:
+                    response = await client.get(
+                        url,
+                        headers=request_headers,
+                        timeout=httpx.Timeout(timeout, connect=30.0)
+                    )
+                if response.status_code != 304:
                     response.raise_for_status()
-                    return response.content
+                return response
             except Exception as e:
                 delay = self.base_delay * (2 ** attempt)  # 指数退避
                 logger.warning(
@@ -105,32 +166,66 @@ class BananaSyncService:
 
         return None
 
-    async def _fetch_github_data(self) -> Optional[List[Dict[str, Any]]]:
-        """从GitHub获取提示词JSON数据"""
+    async def _download_fastest(
+        self,
+        url: str,
+        etag: Optional[str] = None
+    ) -> Optional[httpx.Response]:
+        """
+        同时通过代理和直连下载，返回最先成功的结果
+
+        未配置代理时直接直连下载
+        """
+        if not self._get_proxy_config():
+            return await self._download_with_retry(url, use_proxy=False, etag=etag)
+
+        pending = {
+            asyncio.create_task(self._download_with_retry(url, use_proxy=True, etag=etag)),
+            asyncio.create_task(self._download_with_retry(url, use_proxy=False, etag=etag)),
+        }
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    response = task.result()
+                    if response is not None:
+                        return response
+            return None
+        finally:
+            # 取消仍在进行的另一路下载
+            for task in pending:
+                task.cancel()
+
+    async def _fetch_github_data(self) -> Tuple[Any, Optional[str]]:
+        """
+        从GitHub获取提示词JSON数据
+
+        Returns:
+            (数据, ETag)；数据未变化时为 NOT_MODIFIED，获取失败时为 None
+        """
         logger.info(f"开始从GitHub获取数据: {self.github_url}")
 
-        # 尝试使用代理
-        content = await self._download_with_retry(self.github_url, use_proxy=True)
+        # 代理与直连同时进行，取先成功的一路
+        response = await self._download_fastest(self.github_url, etag=self._github_etag)
 
-        # 如果代理失败，尝试直连
-        if content is None and self._get_proxy_config():
-            logger.info("代理获取失败，尝试直连")
-            content = await self._download_with_retry(self.github_url, use_proxy=False)
+        if response is not None and response.status_code == 304:
+            logger.info("GitHub数据未变化")
+            return NOT_MODIFIED, self._github_etag
 
-        if content:
-            import json
+        if response is not None and response.content:
             try:
-                data = json.loads(content.decode("utf-8"))
+                # 直接解析字节，避免先解码出一份完整的字符串副本
+                data = orjson.loads(response.content)
                 logger.info(f"成功获取 {len(data)} 条提示词数据")
-                return data
-            except json.JSONDecodeError as e:
+                return data, response.headers.get("ETag")
+            except orjson.JSONDecodeError as e:
                 logger.error(f"JSON解析失败: {e}")
-                return None
+                return None, None
 
         logger.error("无法从GitHub获取数据")
-        return None
+        return None, None
 
-    async def sync(self, db: Session) -> Dict[str, Any]:
+    async def sync(self, db: AsyncSession) -> Dict[str, Any]:
         """
         执行增量同步（基于title匹配）
 
@@ -146,35 +241,67 @@ class BananaSyncService:
                 "count": 0
             }
 
+        # 已有同步在进行时直接跳过（定时任务与手动触发可能重叠）
+        if self._sync_lock.locked():
+            return {
+                "success": False,
+                "message": "同步正在进行中",
+                "count": 0
+            }
+
+        async with self._sync_lock:
+            return await self._sync(db)
+
+    async def _sync(self, db: AsyncSession) -> Dict[str, Any]:
+        """执行同步（调用方需持有同步锁）"""
         # 创建同步日志
         sync_log = BananaSyncLog(status="pending")
         db.add(sync_log)
-        db.commit()
-        db.refresh(sync_log)
+        await db.commit()
 
         try:
             # 获取GitHub数据
-            github_data = await self._fetch_github_data()
+            github_data, etag = await self._fetch_github_data()
 
             if github_data is None:
                 sync_log.status = "failed"
                 sync_log.message = "无法从GitHub获取数据"
-                db.commit()
+                await db.commit()
                 return {
                     "success": False,
                     "message": "无法从GitHub获取数据",
                     "count": 0
                 }
 
-            # 获取现有 GitHub 提示词，构建 title -> prompt 映射
-            existing_prompts = db.query(BananaPrompt).filter(
-                BananaPrompt.source == "github"
-            ).all()
-            existing_titles = {p.title: p for p in existing_prompts}
+            # GitHub 数据未变化，跳过数据库比对
+            if github_data is NOT_MODIFIED:
+                total_count = await db.scalar(
+                    select(func.count()).select_from(BananaPrompt)
+                    .where(BananaPrompt.source == "github")
+                )
+                sync_log.status = "success"
+                sync_log.count = total_count
+                sync_log.message = "数据未变化，无需同步"
+                await db.commit()
+
+                logger.info(sync_log.message)
+
+                return {
+                    "success": True,
+                    "message": sync_log.message,
+                    "count": total_count
+                }
+
+            # 获取现有 GitHub 提示词，构建 title -> id 映射（只查询 id 和 title 两列，分批流式读取）
+            result = await db.stream(
+                select(BananaPrompt.id, BananaPrompt.title)
+                .where(BananaPrompt.source == "github")
+                .execution_options(yield_per=500)
+            )
+            existing_titles = {title: prompt_id async for prompt_id, title in result}
 
             # 保存所有提示词（不下载图片）
-            new_count = 0
-            deleted_count = 0
+            new_rows = []
             json_titles = set()
 
             for item in github_data:
@@ -185,30 +312,49 @@ class BananaSyncService:
                 if title in existing_titles:
                     continue
 
-                # 新增提示词（image=None，保存 image_url 供前端下载）
-                image_url = item.get("preview") or item.get("image")
-                prompt = BananaPrompt(
-                    title=title,
-                    prompt=item.get("prompt") or item.get("content", ""),
-                    mode=item.get("mode", "generate"),
-                    category=item.get("category"),
-                    author=item.get("author"),
-                    link=item.get("link"),
-                    image=None,  # 图片由前端下载
-                    image_url=image_url,
-                    source="github"
+                # 新增提示词（不含图片，保存 image_url 供前端下载）
+                new_rows.append({
+                    "title": title,
+                    "prompt": item.get("prompt") or item.get("content", ""),
+                    "mode": item.get("mode", "generate"),
+                    "category": item.get("category"),
+                    "author": item.get("author"),
+                    "link": item.get("link"),
+                    "image_url": item.get("preview") or item.get("image"),
+                    "source": "github",
+                })
+
+            # 批量插入新增提示词
+            new_count = len(new_rows)
+            if new_rows:
+                await db.execute(insert(BananaPrompt), new_rows)
+
+            # 一条语句删除 JSON 中不存在的提示词
+            stale_ids = [
+                prompt_id for title, prompt_id in existing_titles.items()
+                if title not in json_titles
+            ]
+            deleted_count = len(stale_ids)
+            stale_image_paths = []
+            if stale_ids:
+                result = await db.execute(
+                    select(BananaPrompt.image_path).where(
+                        BananaPrompt.id.in_(stale_ids),
+                        BananaPrompt.image_path.isnot(None)
+                    )
+                )
+                stale_image_paths = result.scalars().all()
+                await db.execute(
+                    delete(BananaPrompt).where(BananaPrompt.id.in_(stale_ids))
                 )
-                db.add(prompt)
-                new_count += 1
-
-            # 删除 JSON 中不存在的提示词
-            for title, prompt in existing_titles.items():
-                if title not in json_titles:
-                    db.delete(prompt)
-                    deleted_count += 1
 
             # 提交
-            db.commit()
+            await db.commit()
+            # 删除已移除提示词的图片文件
+            for image_path in stale_image_paths:
+                await asyncio.to_thread(delete_image, image_path)
+            # 数据已入库，记录 ETag 供下次条件请求
+            self._github_etag = etag
 
             # 更新同步日志
             total_count = len(existing_titles) - deleted_count + new_count
@@ -218,7 +364,7 @@ class BananaSyncService:
                 f"同步完成: 新增 {new_count}, 删除 {deleted_count}, "
                 f"保留 {len(existing_titles) - deleted_count}"
             )
-            db.commit()
+            await db.commit()
 
             logger.info(sync_log.message)
 
@@ -232,7 +378,7 @@ class BananaSyncService:
             logger.error(f"同步失败: {e}")
             sync_log.status = "failed"
             sync_log.message = str(e)
-            db.commit()
+            await db.commit()
 
             return {
                 "success": False,
@@ -240,11 +386,12 @@ class BananaSyncService:
                 "count": 0
             }
 
-    def get_latest_sync_status(self, db: Session) -> Optional[BananaSyncLog]:
+    async def get_latest_sync_status(self, db: AsyncSession) -> Optional[BananaSyncLog]:
         """获取最近一次同步状态"""
-        return db.query(BananaSyncLog).order_by(
-            BananaSyncLog.synced_at.desc()
-        ).first()
+        result = await db.execute(
+            select(BananaSyncLog).order_by(BananaSyncLog.synced_at.desc()).limit(1)
+        )
+        return result.scalars().first()
 
 
 # 单例实例
@@ -253,10 +400,7 @@ banana_sync_service = BananaSyncService()
 
 async def sync_from_github():
     """便捷函数：执行同步（用于定时任务）"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         result = await banana_sync_service.sync(db)
         logger.info(f"定时同步结果: {result}")
         return result
-    finally:
-        db.close()
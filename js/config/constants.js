@@ -33,6 +33,7 @@ export const ENDPOINTS = {
     // Banana Prompts (提示词快查)
     BANANA_PROMPTS: '/api/banana/prompts',
     BANANA_PROMPT_BY_ID: (id) => `/api/banana/prompts/${id}`,
+    BANANA_PROMPT_IMAGE: (id) => `/api/banana/prompts/${id}/image`,
     BANANA_SYNC: '/api/banana/sync',
     BANANA_SYNC_STATUS: '/api/banana/sync/status'
 };
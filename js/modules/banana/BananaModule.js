@@ -8,6 +8,7 @@ import { escapeHtml } from '../../utils/format.js';
 import { $, $$, clearElement } from '../../utils/dom.js';
 import bananaService from '../../services/bananaService.js';
 import auth from '../../core/auth.js';
+import { API_BASE_URL, ENDPOINTS } from '../../config/constants.js';
 
 /**
  * Banana Module
@@ -536,8 +537,8 @@ export class BananaModule {
 
         const modeTagClass = item.mode === 'generate' ? 'mode-generate' : 'mode-edit';
         const placeholder = 'https://placehold.co/600x400/e2e8f0/94a3b8?text=No+Preview';
-        // Use image (base64) first, then image_url (original URL), then placeholder
-        const preview = item.image || item.image_url || placeholder;
+        // Use stored image first, then image_url (original URL), then placeholder
+        const preview = this._getPreviewUrl(item) || placeholder;
         // Always use placeholder as fallback to avoid loading same failing URL twice
         const fallbackUrl = placeholder;
         const title = item.title || '无标题';
@@ -632,7 +633,10 @@ export class BananaModule {
             if (categoryInput) categoryInput.value = item.category || '';
             if (authorInput) authorInput.value = item.author || '';
             if (linkInput) linkInput.value = item.link || '';
-            if (item.image) this._setFormImage(item.image);
+            // Stored images are served as files, preview them by URL
+            if (item.has_image) {
+                this._setFormImage(this._getPreviewUrl(item));
+            }
         } else {
             // Create mode
             if (formTitle) formTitle.textContent = '新增提示词';
@@ -700,6 +704,11 @@ export class BananaModule {
             image: imagePreview?.src && imagePreview.style.display !== 'none' ? imagePreview.src : null
         };
 
+        // Unchanged stored image is shown by URL, don't send it back
+        if (data.image && !data.image.startsWith('data:')) {
+            delete data.image;
+        }
+
         try {
             if (this.editingPrompt) {
                 // Update
@@ -887,8 +896,8 @@ export class BananaModule {
 
         const modeTagClass = item.mode === 'generate' ? 'mode-generate' : 'mode-edit';
         const placeholder = 'https://placehold.co/600x400/e2e8f0/94a3b8?text=No+Preview';
-        // Use image (base64) first, then image_url (original URL), then placeholder
-        const preview = item.image || item.image_url || placeholder;
+        // Use stored image first, then image_url (original URL), then placeholder
+        const preview = this._getPreviewUrl(item) || placeholder;
         // Always use placeholder as fallback to avoid loading same failing URL twice
         const fallbackUrl = placeholder;
         const title = item.title || '无标题';
@@ -956,6 +965,17 @@ export class BananaModule {
         return card;
     }
 
+    /**
+     * Gets the preview image URL for a prompt
+     * @private
+     */
+    _getPreviewUrl(item) {
+        if (item.has_image) {
+            return `${API_BASE_URL}${ENDPOINTS.BANANA_PROMPT_IMAGE(item.id)}`;
+        }
+        return item.image_url;
+    }
+
     /**
      * Copies prompt to clipboard
      * @param {string} content - Prompt content
@@ -1001,14 +1021,13 @@ export class BananaModule {
             console.log('[BananaModule] Sample item:', {
                 id: sample.id,
                 title: sample.title,
-                hasImage: !!sample.image,
-                imageUrl: sample.image_url,
-                imageLength: sample.image ? sample.image.length : 0
+                hasImage: !!sample.has_image,
+                imageUrl: sample.image_url
             });
         }
 
         // Filter items that need image supplement
-        const pending = data.filter(item => !item.image && item.image_url);
+        const pending = data.filter(item => !item.has_image && item.image_url);
 
         console.log('[BananaModule] Items needing sync:', pending.length);
 
@@ -1088,7 +1107,7 @@ export class BananaModule {
                     console.log(`[BananaModule] Uploaded to backend for: ${item.title}`);
 
                     // 更新本地缓存
-                    item.image = base64;
+                    item.has_image = true;
 
                     // 刷新卡片显示
                     this._refreshCardImage(item.id, base64);